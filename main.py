@@ -1,11 +1,135 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response
+from collections import OrderedDict
+import asyncio
+import hashlib
+import numpy as np
+import orjson
 import pandas as pd
-import io
+from python_calamine import CalamineError, CalamineWorkbook
 
 app = FastAPI()
 
+REQUIRED_COLUMNS = ["road_name", "pcivalue_2019", "pcivalue_2021"]
+# Hashed lookup for matching sheet headers
+_REQUIRED_LOOKUP = frozenset(REQUIRED_COLUMNS)
+
+# Upload limits, checked before any hashing or parsing. Content-Length covers
+# the whole multipart body, so it gets an allowance for boundaries and headers.
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# curl and some browsers send .xlsx as application/octet-stream; calamine
+# still rejects non-Excel bytes when it parses them
+EXCEL_CONTENT_TYPES = frozenset({
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.ms-excel",
+    "application/octet-stream",
+})
+
+# Validation errors reported per upload before the list is truncated
+MAX_VALIDATION_ERRORS = 100
+
+# Encoded responses for recently parsed workbooks, keyed by content hash.
+# Bounded by total body bytes, since one workbook can encode to tens of MB.
+PARSE_CACHE_BYTES = 64 * 1024 * 1024
+_parse_cache = OrderedDict()
+_parse_cache_bytes = 0
+
+
+def _file_digest(fileobj):
+    fileobj.seek(0)
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: fileobj.read(1 << 20), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.digest()
+
+
+def _cache_body(key, body):
+    global _parse_cache_bytes
+    # Bodies over the whole budget are never cached
+    if len(body) > PARSE_CACHE_BYTES or key in _parse_cache:
+        return
+    _parse_cache[key] = body
+    _parse_cache_bytes += len(body)
+    while _parse_cache_bytes > PARSE_CACHE_BYTES:
+        _, evicted = _parse_cache.popitem(last=False)
+        _parse_cache_bytes -= len(evicted)
+
+
+def _as_json_numbers(values):
+    # calamine reports every numeric cell as a float; keep whole numbers as ints
+    if np.array_equal(values, np.trunc(values)):
+        return values.astype(np.int64).tolist()
+    return values.tolist()
+
+
+def _cell_text(value):
+    # Numeric road names arrive as floats too; "101" must not become "101.0"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _parse_workbook(fileobj):
+    try:
+        sheet = CalamineWorkbook.from_filelike(fileobj).get_sheet_by_index(0)
+        rows = sheet.to_python(skip_empty_area=False)
+    except CalamineError as e:
+        raise HTTPException(400, f"Error processing file: {e}")
+    headers = rows[0] if rows else []
+
+    # Validate columns
+    header_index = {}
+    for i, header in enumerate(headers):
+        if header in _REQUIRED_LOOKUP:
+            header_index.setdefault(header, i)
+    missing = [col for col in REQUIRED_COLUMNS if col not in header_index]
+    if missing:
+        raise HTTPException(400, f"Missing columns: {', '.join(missing)}")
+
+    # Blank cells come back as ""; skip rows that are empty across the whole
+    # sheet, keeping their positions so error row numbers stay accurate
+    filled = [n for n in range(1, len(rows)) if any(cell != "" for cell in rows[n])]
+    df = pd.DataFrame(
+        {col: [rows[n][i] for n in filled] for col, i in header_index.items()},
+        index=filled,
+    )
+
+    # Validate values column-wise
+    # Road names repeat across segments; map() on a categorical runs once per
+    # distinct name, so rows share the resulting str objects
+    names = df["road_name"].astype("category").map(_cell_text, na_action="ignore")
+    a19 = pd.to_numeric(df["pcivalue_2019"], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    a21 = pd.to_numeric(df["pcivalue_2021"], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    bad_type = np.isnan(a19) | np.isnan(a21)
+    # One pass per bound over both years; np.maximum/np.minimum propagate
+    # NaN and NaN compares False, so non-numeric rows never land in bad_range
+    bad_range = (np.maximum(a19, a21) > 5) | (np.minimum(a19, a21) < 1)
+    bad_name = (names.isna() | names.eq("")).to_numpy()
+
+    # The frame is indexed by position in rows; Excel rows are 1-based
+    row_numbers = df.index.to_numpy() + 1
+    # Only format messages for the first few failures of each kind
+    limit = MAX_VALIDATION_ERRORS
+    errors = [f"Row {n}: road_name is empty" for n in row_numbers[bad_name][:limit]]
+    errors += [f"Row {n}: PCI values must be numeric" for n in row_numbers[bad_type][:limit]]
+    errors += [f"Row {n}: PCI values must be between 1 and 5" for n in row_numbers[bad_range][:limit]]
+    if errors:
+        total = bad_name.sum() + bad_type.sum() + bad_range.sum()
+        errors = errors[:limit]
+        if total > limit:
+            errors.append("... truncated")
+        raise HTTPException(400, "; ".join(errors))
+
+    # Serialize straight from the columns, skipping to_dict and jsonable_encoder
+    data = [
+        {"road_name": name, "pcivalue_2019": v19, "pcivalue_2021": v21}
+        for name, v19, v21 in zip(names.tolist(), _as_json_numbers(a19), _as_json_numbers(a21))
+    ]
+    return orjson.dumps({"status": "success", "data": data})
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -15,10 +139,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Root endpoint
-@app.get("/", response_class=HTMLResponse)
-async def root():
-    return """
+# Static bodies are encoded once at import. Each request still gets a fresh
+# Response, since CORSMiddleware edits the headers of the message it sends.
+_ROOT_BODY = """
     <html>
         <head>
             <title>PCI Analysis API</title>
@@ -28,34 +151,43 @@ async def root():
             <p>Use POST /upload_excel/ to upload Excel files</p>
         </body>
     </html>
-    """
+    """.encode()
+_HEALTH_BODY = orjson.dumps({"status": "healthy"})
+
+# Root endpoint
+@app.get("/", response_class=HTMLResponse)
+async def root():
+    return HTMLResponse(_ROOT_BODY)
 
 # Excel upload endpoint
 @app.post("/upload_excel/")
-async def upload_excel(file: UploadFile = File(...)):
-    try:
-        # Validate file type
-        if not file.filename.endswith(('.xlsx', '.xls')):
-            raise HTTPException(400, "Only Excel files are allowed")
-
-        # Read and parse file
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents), engine='openpyxl')
-        
-        # Validate columns
-        required = ["road_name", "pcivalue_2019", "pcivalue_2021"]
-        missing = [col for col in required if col not in df.columns]
-        if missing:
-            raise HTTPException(400, f"Missing columns: {', '.join(missing)}")
-
-        # Convert to list of dictionaries
-        data = df[required].to_dict(orient='records')
-        return {"status": "success", "data": data}
-        
-    except Exception as e:
-        raise HTTPException(500, f"Error processing file: {str(e)}")
+async def upload_excel(request: Request, file: UploadFile = File(...)):
+    # Validate upload size
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(413, "File too large")
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(413, "File too large")
+
+    # Validate file type
+    if not file.filename.endswith(('.xlsx', '.xls')):
+        raise HTTPException(400, "Only Excel files are allowed")
+    if file.content_type and file.content_type not in EXCEL_CONTENT_TYPES:
+        raise HTTPException(400, "Only Excel files are allowed")
+
+    # Re-uploads of an unchanged workbook skip the parse entirely
+    # Hashing and parsing are blocking, so both run in a worker thread
+    key = await asyncio.to_thread(_file_digest, file.file)
+    body = _parse_cache.get(key)
+    if body is None:
+        body = await asyncio.to_thread(_parse_workbook, file.file)
+        _cache_body(key, body)
+    else:
+        _parse_cache.move_to_end(key)
+
+    return Response(body, media_type="application/json")
 
 # Health check
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return Response(_HEALTH_BODY, media_type="application/json")
@@ -0,0 +1,159 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from openpyxl import Workbook
+
+import main
+
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+HEADERS = ["road_name", "pcivalue_2019", "pcivalue_2021"]
+
+
+@pytest.fixture
+def client():
+    main._parse_cache.clear()
+    main._parse_cache_bytes = 0
+    return TestClient(main.app)
+
+
+def make_xlsx(rows):
+    wb = Workbook()
+    ws = wb.active
+    for row in rows:
+        ws.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def post_workbook(client, content, content_type=XLSX):
+    return client.post("/upload_excel/", files={"file": ("roads.xlsx", content, content_type)})
+
+
+def upload(client, rows, content_type=XLSX):
+    return post_workbook(client, make_xlsx(rows), content_type)
+
+
+def test_upload_returns_rows(client):
+    response = upload(client, [HEADERS, ["Main St", 3, 4], [" Oak Ave ", 1, 5]])
+    assert response.status_code == 200
+    assert response.json() == {
+        "status": "success",
+        "data": [
+            {"road_name": "Main St", "pcivalue_2019": 3, "pcivalue_2021": 4},
+            {"road_name": "Oak Ave", "pcivalue_2019": 1, "pcivalue_2021": 5},
+        ],
+    }
+
+
+def test_missing_columns_is_400(client):
+    response = upload(client, [["road_name", "pcivalue_2019"], ["Main St", 3]])
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Missing columns: pcivalue_2021"
+
+
+def test_upload_size_limit(client, monkeypatch):
+    rows = [HEADERS, ["Main St", 3, 4]]
+    size = len(make_xlsx(rows))
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", size + 10)
+    assert upload(client, rows).status_code == 200
+
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", size - 10)
+    response = upload(client, rows)
+    assert response.status_code == 413
+    assert response.json()["detail"] == "File too large"
+
+
+@pytest.mark.parametrize("content_type", ["application/octet-stream", ""])
+def test_generic_content_types_are_accepted(client, content_type):
+    response = upload(client, [HEADERS, ["Main St", 3, 4]], content_type)
+    assert response.status_code == 200
+
+
+def test_non_excel_content_type_is_400(client):
+    response = upload(client, [HEADERS, ["Main St", 3, 4]], "text/csv")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Only Excel files are allowed"
+
+
+def test_invalid_values_are_400(client):
+    response = upload(client, [HEADERS, ["Main St", 0, 4], [None, 3, "n/a"]])
+    assert response.status_code == 400
+    assert response.json()["detail"] == (
+        "Row 3: road_name is empty; "
+        "Row 3: PCI values must be numeric; "
+        "Row 2: PCI values must be between 1 and 5"
+    )
+
+
+def test_cache_evicts_by_body_bytes(monkeypatch):
+    monkeypatch.setattr(main, "_parse_cache", main.OrderedDict())
+    monkeypatch.setattr(main, "_parse_cache_bytes", 0)
+    monkeypatch.setattr(main, "PARSE_CACHE_BYTES", 10)
+
+    main._cache_body(b"a", b"x" * 6)
+    main._cache_body(b"b", b"y" * 6)
+    assert list(main._parse_cache) == [b"b"]
+    assert main._parse_cache_bytes == 6
+
+    main._cache_body(b"c", b"z" * 11)
+    assert list(main._parse_cache) == [b"b"]
+
+
+def test_repeat_upload_is_served_from_cache(client, monkeypatch):
+    workbook = make_xlsx([HEADERS, ["Main St", 3, 4]])
+    other = make_xlsx([HEADERS, ["Oak Ave", 1, 5]])
+    first = post_workbook(client, workbook)
+    post_workbook(client, other)
+    assert len(main._parse_cache) == 2
+
+    def fail(fileobj):
+        raise AssertionError("cached upload was parsed again")
+
+    monkeypatch.setattr(main, "_parse_workbook", fail)
+    second = post_workbook(client, workbook)
+    assert second.status_code == 200
+    assert second.content == first.content
+    # A hit moves the entry to the most-recently-used end
+    assert list(main._parse_cache.values())[-1] == first.content
+
+
+def test_failed_parse_is_not_cached(client):
+    response = upload(client, [HEADERS, ["Main St", 0, 4]])
+    assert response.status_code == 400
+    assert not main._parse_cache
+
+
+def test_blank_rows_are_skipped_but_partial_rows_are_not(client):
+    rows = [HEADERS + ["notes"], ["Main St", 3, 4], [], [None, None, None, "not surveyed"]]
+    response = upload(client, rows)
+    assert response.status_code == 400
+    assert response.json()["detail"] == (
+        "Row 4: road_name is empty; Row 4: PCI values must be numeric"
+    )
+
+
+@pytest.mark.parametrize("row", [[None, 3, 4], ["Main St", 9, 4]])
+def test_validation_errors_are_truncated(client, monkeypatch, row):
+    monkeypatch.setattr(main, "MAX_VALIDATION_ERRORS", 3)
+    response = upload(client, [HEADERS] + [row] * 5)
+    assert response.status_code == 400
+    messages = response.json()["detail"].split("; ")
+    assert len(messages) == 4
+    assert messages[-1] == "... truncated"
+
+
+def test_validation_errors_at_limit_are_not_truncated(client, monkeypatch):
+    monkeypatch.setattr(main, "MAX_VALIDATION_ERRORS", 3)
+    response = upload(client, [HEADERS] + [["Main St", 9, 4]] * 3)
+    assert "truncated" not in response.json()["detail"]
+
+
+def test_headers_match_exactly(client):
+    rows = [["ROAD_NAME"] + HEADERS, ["OLD CODE", "Main St", 3, 4]]
+    response = upload(client, rows)
+    assert response.status_code == 200
+    assert response.json()["data"] == [
+        {"road_name": "Main St", "pcivalue_2019": 3, "pcivalue_2021": 4}
+    ]